@@ -91,7 +91,8 @@ class ShallowGaussianPolicy(ContinuousPolicy):
                 return self.mu(x)
             
             sigma = torch.exp(self.logstd.data)
-            a = self.mu(x) + self._pdf.sample() * sigma
+            mu = self.mu(x)
+            a = mu + self._pdf.sample(mu.shape[:-1]) * sigma #independent noise per state
             if self.squash_fun is not None:
                 a = self.squash_fun(a)
             return a
@@ -251,7 +252,8 @@ class DeepGaussianPolicy(ContinuousPolicy):
                 return self.mu(x)
             
             sigma = torch.exp(self.logstd.data)
-            a = self.mu(x) + self._pdf.sample() * sigma
+            mu = self.mu(x)
+            a = mu + self._pdf.sample(mu.shape[:-1]) * sigma #independent noise per state
             if self.squash_fun is not None:
                 a = self.squash_fun(a)
             return a
@@ -404,7 +406,8 @@ class ShallowSquashedPolicy(ContinuousPolicy):
                 return self.scale * torch.tanh(self.mu(x)) + self.shift
             
             sigma = torch.exp(self.logstd.data)
-            u = self.mu(x) + self._pdf.sample() * sigma
+            mu = self.mu(x)
+            u = mu + self._pdf.sample(mu.shape[:-1]) * sigma #independent noise per state
             
             #Squashing
             a = self.scale * torch.tanh(u) + self.shift
@@ -589,7 +592,8 @@ class DeepSquashedPolicy(ContinuousPolicy):
                 return self.scale * torch.tanh(self.mu(x)) + self.shift
             
             sigma = torch.exp(self.logstd.data)
-            u = self.mu(x) + self._pdf.sample() * sigma
+            mu = self.mu(x)
+            u = mu + self._pdf.sample(mu.shape[:-1]) * sigma #independent noise per state
             
             #Squashing
             a = self.scale * torch.tanh(u) + self.shift
@@ -6,7 +6,7 @@ Created on Wed Jan 16 16:18:45 2019
 @author: matteo
 """
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import performance, avg_horizon
+from potion.common.misc_utils import performance, batch_stats
 from potion.estimation.gradients import gpomdp_estimator
 from potion.estimation.metagradients import metagrad
 from potion.common.logger import Logger
@@ -126,9 +126,8 @@ def mepg(env, policy,
         log_row['OmegaMetagrad'] = omega_metagrad.item()
         log_row['UpsilonGradNorm'] = torch.norm(upsilon_grad).item()
         log_row['BatchSize'] = batchsize
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         params = policy.get_flat()
         if log_params:
             for i in range(policy.num_params()):
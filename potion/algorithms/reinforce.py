@@ -5,8 +5,8 @@ REINFORCE family of algorithms (actor-only policy gradient)
 @author: Matteo Papini
 """
 
-from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import performance, avg_horizon, mean_sum_info
+from potion.simulation.trajectory_generators import generate_batch, copy_envs
+from potion.common.misc_utils import performance, batch_stats, mean_sum_info
 from potion.estimation.gradients import gpomdp_estimator, reinforce_estimator, egpomdp_estimator
 from potion.common.logger import Logger
 from potion.common.misc_utils import clip, seed_all_agent
@@ -34,6 +34,7 @@ def reinforce(env, policy, horizon, *,
                     log_params = False,
                     log_grad = False,
                     parallel = False,
+                    vectorized = False,
                     render = False,
                     verbose = 1):
     """
@@ -68,6 +69,8 @@ def reinforce(env, policy, horizon, *,
     log_grad: whether to include gradients in the human-readable logs
     parallel: number of parallel jobs for simulation. If 0 or False, 
         sequential simulation is performed.
+    vectorized: whether to simulate the training batch in lockstep, with one
+        batched policy query per time step (overrides parallel)
     render: how often (every x iterations) to render the agent's behavior
         on a sample trajectory. If False, no rendering happens
     verbose: level of verbosity (0: only logs; 1: normal; 2: maximum)
@@ -114,6 +117,9 @@ def reinforce(env, policy, horizon, *,
     log_row = dict.fromkeys(log_keys)
     logger.open(log_row.keys())
     
+    #Environment copies for vectorized simulation (made before any rendering)
+    sim_envs = copy_envs(env, batchsize, seed) if vectorized else None
+    
     #Learning loop
     it = 0
     while(it < iterations):
@@ -150,11 +156,11 @@ def reinforce(env, policy, horizon, *,
                                action_filter=action_filter, 
                                seed=seed, 
                                n_jobs=parallel,
-                               key=info_key)
-        log_row['Perf'] = performance(batch, disc)
+                               key=info_key,
+                               envs=sim_envs)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['Exploration'] = policy.exploration().item()
         log_row['Entropy'] = policy.entropy(0.).item()
     
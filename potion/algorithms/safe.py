@@ -6,7 +6,7 @@ Safe Policy Gradient algorithms
 """
 
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import (performance, avg_horizon, mean_sum_info, 
+from potion.common.misc_utils import (performance, batch_stats, mean_sum_info, 
                                       clip, seed_all_agent, returns, separator)
 from potion.estimation.gradients import gpomdp_estimator, reinforce_estimator
 from potion.common.logger import Logger
@@ -236,10 +236,9 @@ def safepg(env, policy, horizon, lip_const, var_bound, *,
         
         #Log
         log_row['Safety'] = safety
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['GradNorm'] = torch.norm(grad).item()
         log_row['BatchSize'] = batchsize
         log_row['TotSamples'] = tot_samples
@@ -418,11 +417,10 @@ def safepg_exact(env, policy, horizon,
             
         #Log
         log_row['Safety'] = safety
-        log_row['Perf'] = performance(test_batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(test_batch, disc)
         log_row['ExPerf'] = env._performance(params, std, disc, horizon=horizon).item()
         log_row['Info'] = mean_sum_info(test_batch).item()
         log_row['UPerf'] = performance(test_batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(test_batch)
         log_row['GradNorm'] = torch.norm(grad).item()
         log_row['TotSamples'] = tot_samples
         if log_params:
@@ -654,10 +652,9 @@ def adastep(env, policy, horizon, pen_coeff, var_bound, *,
         
         #Log
         log_row['Safety'] = safety
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['GradNorm'] = torch.norm(grad).item()
         log_row['BatchSize'] = batchsize
         log_row['TotSamples'] = tot_samples
@@ -974,10 +971,9 @@ def adabatch(env, policy, horizon, pen_coeff, *,
         #Log
         log_row['Err'] = eps
         log_row['Safety'] = safety
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['GradNorm'] = torch.norm(grad).item()
         log_row['GradInfNorm'] = grad_infnorm.item()
         log_row['BatchSize'] = batchsize
@@ -6,7 +6,7 @@ Created on Wed Jan 16 16:18:45 2019
 @author: matteo
 """
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import performance, avg_horizon
+from potion.common.misc_utils import performance, batch_stats
 from potion.estimation.gradients import gpomdp_estimator
 from potion.estimation.metagradients import mixed_estimator, metagrad
 from potion.common.logger import Logger
@@ -168,7 +168,7 @@ def sepg(env, policy,
                 log_row['Up'] = torch.tensor(omega_grad).item()
                 log_row['Down'] = torch.tensor(omega_metagrad).item()
         
-            perf = performance(batch, gamma)
+            perf, H = batch_stats(batch, gamma)
             Co = thresholder.next(perf)
             Co = min(Co, Cmax)
             log_row['C'] = Co
@@ -210,7 +210,7 @@ def sepg(env, policy,
             penalty = rmax * phimax**2 / (1-gamma)**2 * (avol / (sigma * math.sqrt(2*math.pi)) + gamma / (2*(1-gamma)))
             alpha_star = sigma ** 2 * norm2 ** 2 / (2 * penalty * norm1 ** 2 + 1e-12)
             Cmax = (alpha_star * norm2**2 / 2).item()
-            perf = performance(batch, gamma)
+            perf, H = batch_stats(batch, gamma)
             Co = thresholder.next(perf)
             Co = min(Co, Cmax)
             log_row['C'] = Co
@@ -237,7 +237,7 @@ def sepg(env, policy,
         log_row['Alpha'] = alpha.item()
         log_row['Perf'] = perf
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
+        log_row['AvgHorizon'] = H
         params = policy.get_flat()
         if log_params:
             for i in range(policy.num_params()):
@@ -368,9 +368,8 @@ def adastep(env, policy,
         log_row['BatchSize'] = batchsize
         log_row['Exploration'] = policy.exploration()
         log_row['Alpha'] = alpha.item()
-        log_row['Perf'] = performance(batch, gamma)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, gamma)
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         params = policy.get_flat()
         if log_params:
             for i in range(policy.num_params()):
@@ -486,9 +485,8 @@ def adabatch(env, policy,
         log_row['BatchSize'] = batchsize
         log_row['Exploration'] = policy.exploration()
         log_row['Alpha'] = alpha
-        log_row['Perf'] = performance(batch, gamma)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, gamma)
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         params = policy.get_flat()
         if log_params:
             for i in range(policy.num_params()):
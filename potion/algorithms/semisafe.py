@@ -6,7 +6,7 @@ Semi-Safe Policy Gradient (SSPG)
 """
 
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import (performance, avg_horizon, mean_sum_info, 
+from potion.common.misc_utils import (performance, batch_stats, mean_sum_info, 
                                       clip, seed_all_agent, returns, separator)
 from potion.estimation.gradients import gpomdp_estimator, reinforce_estimator
 from potion.common.logger import Logger
@@ -269,10 +269,9 @@ def semisafepg(env, policy, horizon, lip_const, *,
         #log_row['UScore'] = torch.norm(grad).item() / math.sqrt(grad_var)
         log_row['Safety'] = safety
         log_row['ErrBound'] = eps
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['GradNorm'] = torch.norm(grad).item()
         log_row['BatchSize'] = batchsize
         log_row['TotSamples'] = tot_samples
@@ -6,7 +6,7 @@ Created on Wed Jan 16 16:18:45 2019
 @author: matteo
 """
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import performance, avg_horizon
+from potion.common.misc_utils import performance, batch_stats
 from potion.estimation.gradients import gpomdp_estimator
 from potion.estimation.metagradients import metagrad
 from potion.common.logger import Logger
@@ -115,8 +115,7 @@ def sepg(env, policy,
                                seed=seed, 
                                n_jobs=parallel,
                                key=info_key)
-        perf = performance(batch, disc)
-        H = avg_horizon(batch)
+        perf, H = batch_stats(batch, disc)
         
         if emp:
             max_rew = max_reward(batch)
@@ -227,7 +226,7 @@ def sepg(env, policy,
         log_row['BatchSize'] = batchsize
         log_row['Perf'] = perf
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
+        log_row['AvgHorizon'] = H
         log_row['UpsilonGradVar'] = upsilon_grad_var
         log_row['UpsilonEps'] = upsilon_eps
         log_row['OmegaGradVar'] = upsilon_grad_var
@@ -347,7 +346,7 @@ def naive_sepg(env, policy,
                                action_filter=action_filter, 
                                seed=seed, 
                                n_jobs=parallel)
-        perf = performance(batch, disc)
+        perf, H = batch_stats(batch, disc)
         
         #Estimate policy gradient
         grad_samples = gpomdp_estimator(batch, disc, policy, 
@@ -440,7 +439,7 @@ def naive_sepg(env, policy,
         log_row['BatchSize'] = batchsize
         log_row['Perf'] = perf
         log_row['UPerf'] = performance(batch, 1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
+        log_row['AvgHorizon'] = H
         log_row['UpsilonGradVar'] = upsilon_grad_var
         log_row['UpsilonEps'] = upsilon_eps
         log_row['OmegaGradVar'] = upsilon_grad_var
@@ -6,7 +6,7 @@ Smooth Policy Gradient (SmoPG)
 """
 
 from potion.simulation.trajectory_generators import generate_batch
-from potion.common.misc_utils import (performance, avg_horizon, mean_sum_info, 
+from potion.common.misc_utils import (performance, batch_stats, mean_sum_info, 
                                       clip, seed_all_agent, returns, separator)
 from potion.estimation.gradients import gpomdp_estimator, reinforce_estimator
 from potion.common.logger import Logger
@@ -203,10 +203,9 @@ def smoothpg(env, policy, horizon, lip_const1, lip_const2, *,
         
         #Log
         log_row['Safety'] = safety
-        log_row['Perf'] = performance(batch, disc)
+        log_row['Perf'], log_row['AvgHorizon'] = batch_stats(batch, disc)
         log_row['Info'] = mean_sum_info(batch).item()
         log_row['UPerf'] = performance(batch, disc=1.)
-        log_row['AvgHorizon'] = avg_horizon(batch)
         log_row['GradNorm'] = grad_norm
         log_row['BatchSize'] = batchsize
         log_row['TotSamples'] = tot_samples
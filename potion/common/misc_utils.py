@@ -10,6 +10,7 @@ import random
 import numpy as np
 import torch
 import os
+from functools import lru_cache
 from gym.spaces.box import Box
 from gym.spaces.discrete import Discrete
 
@@ -27,28 +28,78 @@ def clip(env):
         return np.clip(a, low, high)
     return lambda a : action_filter(a)
 
-def seed_all_agent(seed):
+def seed_all_agent(seed, use_cuda=None):
+    """use_cuda: whether to also seed the CUDA generators (default: if 
+        CUDA is available)"""
     if seed is None:
         return
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
-    if torch.cuda.is_available():
+    if use_cuda is None:
+        use_cuda = torch.cuda.is_available()
+    if use_cuda:
         torch.cuda.manual_seed_all(seed)
         
+class Batch(list):
+    """List of trajectories (states, actions, rewards, mask, infos) that are
+    the rows of batch-wide NxHx* buffers, so that unpack can return the 
+    buffers without copying them.
+    
+    The trajectories are views of the buffers: neither they nor the output 
+    of unpack may be modified in place, and any trajectory kept alive keeps 
+    the whole buffers alive. The list itself may be changed (e.g., with +=), 
+    after which the buffers are no longer used.
+    """
+    def __init__(self, buffers):
+        self.buffers = tuple(buffers)
+        super(Batch, self).__init__(zip(*self.buffers))
+        self._trajectories = tuple(self)
+    
+    def stacked(self):
+        "The buffers, if the batch still holds exactly its own trajectories"
+        if (len(self) == len(self._trajectories) and 
+                all(a is b for a, b in zip(self, self._trajectories))):
+            return self.buffers
+        return None
+
+def _stacked(batch):
+    "Buffers of a Batch, or None for other lists of trajectories"
+    return batch.stacked() if isinstance(batch, Batch) else None
+
+def _stack_field(batch, i):
+    "i-th element of all trajectories, stacked"
+    buffers = _stacked(batch)
+    if buffers is not None:
+        return buffers[i]
+    return torch.stack([traj[i] for traj in batch])
+
 def unpack(batch):
-    "Unpacks list of tuples of tensors into one tuple of stacked arrays"
+    """Unpacks list of tuples of tensors into one tuple of stacked arrays. 
+    For a Batch, these are its own buffers (not copies): do not modify them
+    in place"""
+    buffers = _stacked(batch)
+    if buffers is not None:
+        return (b for b in buffers)
     return (torch.stack(x) for x in zip(*batch))
 
+@lru_cache(maxsize=32)
+def _discount_factors(horizon, disc, device):
+    "Vector of (float32) discount factors disc**t for t=0,...,horizon-1"
+    return torch.pow(torch.tensor(disc, dtype=torch.float, device=device),
+                     torch.arange(horizon, dtype=torch.float, device=device))
+
 def discount(rewards, disc):
-    """rewards: array or tensor"""
-    i = 0 if rewards.dim() < 2 else 1
-    discounts = torch.tensor(disc**np.indices(rewards.shape)[i], dtype=torch.float)
+    """rewards: tensor where the last dimension is time"""
+    discounts = _discount_factors(rewards.shape[-1], float(disc), 
+                                  rewards.device) #H
     return rewards * discounts
         
 def returns(batch, gamma):
-    return [torch.sum(discount(rewards,gamma)).item() 
-                                    for (_, _, rewards, _, _) in batch]
+    rewards = _stack_field(batch, 2) #NxH
+    mask = _stack_field(batch, 3) #NxH
+    return torch.sum(discount(rewards * mask, gamma), 1).tolist()
+
 def max_reward(batch):
     return max(torch.max(torch.abs(rewards)).item() for (_, _, rewards, _, _) in batch)
 
@@ -63,8 +114,17 @@ def performance(batch, disc):
     return torch.mean(torch.tensor(returns(batch, disc))).item()
 
 def avg_horizon(batch):
-    return torch.mean(torch.tensor([torch.sum(mask)
-                       for (_, _, _, mask, _) in batch], dtype=torch.float)).item()
+    mask = _stack_field(batch, 3).float() #NxH
+    return torch.mean(torch.sum(mask, 1)).item()
+
+def batch_stats(batch, disc):
+    "Performance and average horizon of a batch, computed in one pass"
+    rewards = _stack_field(batch, 2) #NxH
+    mask = _stack_field(batch, 3).float() #NxH
+    rets = torch.sum(discount(rewards * mask, disc), 1) #N
+    horizons = torch.sum(mask, 1) #N
+    perf, avg_h = torch.stack((torch.mean(rets), torch.mean(horizons))).tolist()
+    return perf, avg_h
         
 def maybe_make_dir(directory):
     if not os.path.exists(directory):
@@ -5,17 +5,27 @@ Policy gradient stimators
 @author: Matteo Papini
 """
 
+import math
+import warnings
+import numpy as np
 import torch
 import potion.common.torch_utils as tu
 from potion.common.misc_utils import unpack, discount
 from potion.common.torch_utils import tensormat, jacobian
 from potion.estimation.moments import incr_mean, incr_var
+try:
+    import numba
+except ImportError:
+    numba = None
 
 
 def off_gpomdp_estimator(batch, disc, policy, target_params, 
                          baselinekind='avg', 
                          result='mean',
-                         shallow=False):
+                         shallow=False,
+                         target_logps=None,
+                         device=None,
+                         chunk_size=None):
     """G(PO)MDP policy gradient estimator
        
     batch: list of N trajectories generated by behavioral policy. Each trajectory is a tuple 
@@ -23,7 +33,8 @@ def off_gpomdp_estimator(batch, disc, policy, target_params,
         tensor where the first dimension is time.
     disc: discount factor
     policy: the one used to collect the data
-    target_params: parameters of the policy to evaluate
+    target_params: parameters of the policy to evaluate (None: the 
+        behavioral policy itself, i.e., unit importance weights)
     baselinekind: kind of baseline to employ in the estimator. 
         Either 'avg' (average reward, default), 'peters' 
         (variance-minimizing),  or 'zero' (no baseline)
@@ -31,48 +42,213 @@ def off_gpomdp_estimator(batch, disc, policy, target_params,
         single per-trajectory estimates ('samples')
     shallow: whether to use precomputed score functions (only available
         for shallow policies)
+    target_logps: precomputed log-probabilities (NxH) of the batch actions
+        under the target policy (default: computed from target_params)
+    device: where to perform the estimation (default: CUDA if available).
+        The result is always returned on CPU
+    chunk_size: if given, score functions are processed this many 
+        trajectories at a time (in two passes) to cap peak memory
     """
     if shallow:
-        return _shallow_off_gpomdp_estimator(batch, disc, policy, target_params, baselinekind, result)
+        return _shallow_off_gpomdp_estimator(batch, disc, policy, target_params, baselinekind, result, target_logps, device, chunk_size)
     else:
         raise NotImplementedError
 
 "From Mastrangelo's master thesis"
 def _shallow_off_gpomdp_estimator(batch, disc, policy, target_params, 
                                   baselinekind='peters', 
-                                  result='mean'):
+                                  result='mean',
+                                  target_logps=None,
+                                  device=None,
+                                  chunk_size=None):
+    if baselinekind not in ('peters', 'zero'):
+        raise NotImplementedError
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError('chunk_size must be a positive integer')
     with torch.no_grad():        
         states, actions, rewards, mask, _ = unpack(batch) # NxHxm, NxHxd, NxH, NxH
         
         disc_rewards = discount(rewards, disc) #NxH
-        scores = policy.score(states, actions) #NxHxM
-        G = torch.cumsum(tensormat(scores, mask), 1) #NxHxm
-        n_k = torch.sum(mask, dim=0) #H
-        n_k[n_k==0.] = 1.
         behavioral_logps = policy.log_pdf(states, actions) #NxH
-        behavioral_params = policy.get_flat()
-        policy.set_from_flat(target_params)
-        target_logps = policy.log_pdf(states, actions) #NxH
-        policy.set_from_flat(behavioral_params)
-        log_iws = torch.cumsum(target_logps - behavioral_logps, 1) #NxH
-        stabilizers, _ = torch.max(log_iws, dim=1, keepdim=True) #NxH
+        if target_logps is None:
+            if target_params is None:
+                target_logps = behavioral_logps #on-policy: unit weights
+            else:
+                behavioral_params = policy.get_flat()
+                if torch.is_tensor(target_params) and torch.equal(target_params, behavioral_params):
+                    target_logps = behavioral_logps #on-policy: unit weights
+                else:
+                    policy.set_from_flat(target_params)
+                    target_logps = policy.log_pdf(states, actions) #NxH
+                    policy.set_from_flat(behavioral_params)
+        log_ratios = target_logps - behavioral_logps #NxH
         
-        if baselinekind == 'peters':
-            baseline = torch.sum(tensormat(G ** 2, disc_rewards * torch.exp(2*(log_iws - stabilizers))), 0) / \
-                            torch.sum(tensormat(G ** 2, torch.exp(2*(log_iws - stabilizers))), 0) #Hxm
-        elif baselinekind == 'zero':
-            baseline = torch.zeros_like(G[0]) #Hxm
+        #the policy stays where it is, only the estimator algebra is moved
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        disc_rewards = disc_rewards.to(device)
+        mask = mask.to(device)
+        log_ratios = log_ratios.to(device)
+        if chunk_size is not None:
+            _samples = _chunked_off_gpomdp(policy, states, actions, 
+                                           disc_rewards, mask, log_ratios, 
+                                           baselinekind == 'peters', 
+                                           chunk_size) #Nxm
         else:
-            raise NotImplementedError
-        baseline[baseline != baseline] = 0 #removes non-real values
-        values = disc_rewards.unsqueeze(2) - baseline.unsqueeze(0) #NxHxm
-        
-        _samples = torch.sum(tensormat(G * values, mask * torch.exp(log_iws)), 1) #Nxm
+            scores = policy.score(states, actions).to(device) #NxHxm
+            _samples = _compiled_off_gpomdp_core(scores, disc_rewards, mask, 
+                                                 log_ratios, 
+                                                 baselinekind == 'peters') #Nxm
+            if _samples is None:
+                _samples = _eager_off_gpomdp_core(scores, disc_rewards, mask, 
+                                                  log_ratios, 
+                                                  baselinekind == 'peters') #Nxm
         if result == 'samples':
-            return _samples #Nxm
+            return _samples.cpu() #Nxm
         else:
-            return torch.mean(_samples, 0) #m
+            return torch.mean(_samples, 0).cpu() #m
+    
+
+def _cumulative_terms(scores, mask, log_ratios):
+    """Cumulative scores (NxHxm) and log importance weights (NxH)"""
+    G = (scores * mask.unsqueeze(2)).cumsum_(1) #NxHxm, scan in place on the masked scores
+    log_iws = torch.cumsum(log_ratios * mask, 1) #NxH, constant after termination
+    return G, log_iws
+
+def _peters_log_sums(G, log_iws, disc_rewards):
+    """Log-sums over trajectories of G^2 iw^2 (denominator) and of G^2 iw^2 r,
+    split into positive and negative rewards (numerator), each Hxm"""
+    log_w = 2 * (log_iws.unsqueeze(2) + torch.log(torch.abs(G))) #NxHxm, log(G^2 iw^2)
+    log_den = torch.logsumexp(log_w, 0) #Hxm
+    log_pos = torch.logsumexp(log_w + torch.log(disc_rewards.clamp(min=0)).unsqueeze(2), 0) #Hxm
+    log_neg = torch.logsumexp(log_w + torch.log((-disc_rewards).clamp(min=0)).unsqueeze(2), 0) #Hxm
+    return log_den, log_pos, log_neg
+
+def _peters_baseline(log_den, log_pos, log_neg):
+    """Baseline sum(G^2 iw^2 r) / sum(G^2 iw^2) (Hxm) from its log-sums"""
+    baseline = torch.exp(log_pos - log_den) - torch.exp(log_neg - log_den) #Hxm
+    return torch.where(torch.isfinite(log_den), baseline, 
+                       torch.zeros_like(baseline)) #zero where G vanishes
+
+def _off_gpomdp_terms(scores, disc_rewards, mask, log_ratios, peters=True):
+    """Cumulative scores (NxHxm), log importance weights (NxH) and baseline 
+    (Hxm) of the shallow off-policy G(PO)MDP estimator
+    
+    scores: NxHxm, disc_rewards: NxH, mask: NxH, log_ratios: NxH
+    peters: whether to use the variance-minimizing baseline (else zero)
+    """
+    G, log_iws = _cumulative_terms(scores, mask, log_ratios)
+    if peters:
+        baseline = _peters_baseline(*_peters_log_sums(G, log_iws, disc_rewards)) #Hxm
+    else:
+        baseline = torch.zeros_like(G[0]) #Hxm
+    return G, log_iws, baseline
+
+def _weighted_samples(G, log_iws, disc_rewards, mask, baseline):
+    """Per-trajectory estimates (Nxm)"""
+    values = disc_rewards.unsqueeze(2) - baseline.unsqueeze(0) #NxHxm
+    return torch.einsum('nhm,nh->nm', (G * values, mask * torch.exp(log_iws))) #Nxm
+
+def _off_gpomdp_core(scores, disc_rewards, mask, log_ratios, peters=True):
+    """Tensor-only part of the shallow off-policy G(PO)MDP estimator
     
+    scores: NxHxm, disc_rewards: NxH, mask: NxH, log_ratios: NxH
+    peters: whether to use the variance-minimizing baseline (else zero)
+    """
+    G, log_iws, baseline = _off_gpomdp_terms(scores, disc_rewards, mask, 
+                                             log_ratios, peters)
+    return _weighted_samples(G, log_iws, disc_rewards, mask, baseline) #Nxm
+
+def _chunked_off_gpomdp(policy, states, actions, disc_rewards, mask, 
+                        log_ratios, peters, chunk_size):
+    """Per-trajectory estimates (Nxm), computing score functions chunk_size 
+    trajectories at a time: a first pass accumulates the baseline, a second 
+    one recomputes the scores and assembles the estimates"""
+    device = mask.device
+    chunks = [slice(i, i + chunk_size) for i in range(0, len(states), chunk_size)]
+    
+    def chunk_terms(c):
+        scores = policy.score(states[c], actions[c]).to(device) #nxHxm
+        return _cumulative_terms(scores, mask[c], log_ratios[c])
+    
+    baseline = None
+    if peters:
+        sums = None
+        for c in chunks:
+            G, log_iws = chunk_terms(c)
+            chunk_sums = _peters_log_sums(G, log_iws, disc_rewards[c])
+            sums = chunk_sums if sums is None else \
+                    [torch.logaddexp(a, b) for a, b in zip(sums, chunk_sums)]
+        baseline = _peters_baseline(*sums) #Hxm
+    
+    _samples = []
+    for c in chunks:
+        G, log_iws = chunk_terms(c)
+        if baseline is None:
+            baseline = torch.zeros_like(G[0]) #Hxm
+        _samples.append(_weighted_samples(G, log_iws, disc_rewards[c], 
+                                          mask[c], baseline))
+    return torch.cat(_samples, 0) #Nxm
+
+def _numba_off_gpomdp_core(scores, disc_rewards, mask, log_ratios, peters=True):
+    """_off_gpomdp_core with the final reduction done by a Numba kernel
+    (CPU tensors only)"""
+    G, log_iws, baseline = _off_gpomdp_terms(scores, disc_rewards, mask, 
+                                             log_ratios, peters)
+    return torch.from_numpy(_numba_samples(G.numpy(), 
+                                           disc_rewards.contiguous().numpy(), 
+                                           mask.contiguous().numpy(), 
+                                           log_iws.numpy(), 
+                                           baseline.contiguous().numpy())) #Nxm
+
+def _eager_off_gpomdp_core(scores, disc_rewards, mask, log_ratios, peters=True):
+    """_off_gpomdp_core without compilation, using the Numba reduction when 
+    available (CPU, float32)"""
+    if (_numba_samples is not None and scores.device.type == 'cpu' and 
+            scores.dtype == torch.float32):
+        return _numba_off_gpomdp_core(scores, disc_rewards, mask, log_ratios, 
+                                      peters) #Nxm
+    return _off_gpomdp_core(scores, disc_rewards, mask, log_ratios, peters) #Nxm
+
+_compiled_core = None #lazily compiled _off_gpomdp_core, False if unusable
+
+def _compiled_off_gpomdp_core(scores, disc_rewards, mask, log_ratios, peters=True):
+    """_off_gpomdp_core fused by torch.compile (PyTorch >= 2.0), compiled on 
+    first use. Returns None if compilation is unsupported (old PyTorch, 
+    Python version or platform not supported by Dynamo) or fails (e.g., no 
+    C++ toolchain for the CPU backend), so that the caller can fall back"""
+    global _compiled_core
+    if _compiled_core is None:
+        try:
+            _compiled_core = torch.compile(_off_gpomdp_core, dynamic=False)
+        except Exception:
+            _compiled_core = False
+    if _compiled_core is False:
+        return None
+    try:
+        return _compiled_core(scores, disc_rewards, mask, log_ratios, peters)
+    except Exception as e:
+        warnings.warn('Could not compile the estimator, running eagerly: %s' % e)
+        _compiled_core = False
+        return None
+
+if numba is not None:
+    #CPU fallback for the final reduction when the compiled core is unusable
+    @numba.njit(parallel=True)
+    def _numba_samples(G, disc_rewards, mask, log_iws, baseline):
+        N, H, m = G.shape
+        samples = np.zeros((N, m), dtype=G.dtype)
+        for n in numba.prange(N):
+            for t in range(H):
+                if mask[n, t] == 0:
+                    continue
+                iw = math.exp(log_iws[n, t]) * mask[n, t]
+                for k in range(m):
+                    samples[n, k] += G[n, t, k] * (disc_rewards[n, t] - baseline[t, k]) * iw
+        return samples #Nxm
+else:
+    _numba_samples = None
+
 
 #entropy-augmented version
 def egpomdp_estimator(batch, disc, policy, coeff, baselinekind='avg', result='mean',
@@ -158,4 +334,16 @@ if __name__ == '__main__':
                                baselinekind='peters',
                                shallow=True)
     print(on, off)
-    
\ No newline at end of file
+    
+    if _numba_samples is not None:
+        scores = torch.randn(5, 10, 3)
+        disc_rewards = torch.randn(5, 10)
+        mask = torch.ones(5, 10)
+        mask[0, 6:] = 0.
+        log_ratios = 0.1 * torch.randn(5, 10)
+        for peters in (True, False):
+            fast = _numba_off_gpomdp_core(scores, disc_rewards, mask, 
+                                          log_ratios, peters)
+            ref = _off_gpomdp_core(scores, disc_rewards, mask, log_ratios, 
+                                   peters)
+            print('Numba core matches:', torch.allclose(fast, ref, atol=1e-5))
@@ -9,13 +9,26 @@ Created on Sat Jan 12 01:17:17 2019
 import torch
 import numpy as np
 from joblib import Parallel, delayed
-from potion.common.misc_utils import seed_all_agent
+from potion.common.misc_utils import seed_all_agent, Batch
 import random
 import math
+import copy
+
+def _batch_buffers(episodes, horizon, ds, da):
+    """Zero-padded float32 buffers for states, actions, rewards, mask and infos
+    of a whole batch"""
+    return (torch.zeros((episodes, horizon, ds), dtype=torch.float),
+            torch.zeros((episodes, horizon, da), dtype=torch.float),
+            torch.zeros((episodes, horizon), dtype=torch.float),
+            torch.zeros((episodes, horizon), dtype=torch.float),
+            torch.zeros((episodes, horizon), dtype=torch.float))
 
 def sequential_episode_generator(env, policy, horizon=float('inf'), max_episodes=float('inf'),
-                                 action_filter=None, render=False, deterministic=False, key=None):
-    
+                                 action_filter=None, render=False, deterministic=False, key=None,
+                                 buffers=None):
+    """buffers: optional batch-wide buffers (see _batch_buffers) whose n-th 
+        rows are filled with the n-th episode, instead of allocating new 
+        tensors for each episode"""
     ds = sum(env.observation_space.shape)
     ds = max(ds, 1)
     da = sum(env.action_space.shape)
@@ -24,13 +37,16 @@ def sequential_episode_generator(env, policy, horizon=float('inf'), max_episodes
     n = 0
     while n < max_episodes:
         # Episode
-        states = torch.zeros((horizon, ds),
-                             dtype=torch.float)
-        actions = torch.zeros((horizon, da),
-                              dtype=torch.float)
-        rewards = torch.zeros(horizon, dtype=torch.float)
-        mask = torch.zeros(horizon, dtype=torch.float)
-        infos = torch.zeros(horizon, dtype=torch.float)
+        if buffers is not None:
+            states, actions, rewards, mask, infos = (b[n] for b in buffers)
+        else:
+            states = torch.zeros((horizon, ds),
+                                 dtype=torch.float)
+            actions = torch.zeros((horizon, da),
+                                  dtype=torch.float)
+            rewards = torch.zeros(horizon, dtype=torch.float)
+            mask = torch.zeros(horizon, dtype=torch.float)
+            infos = torch.zeros(horizon, dtype=torch.float)
         s = env.reset()
         done = False
         t = 0
@@ -77,7 +93,7 @@ def parallel_episode_generator(env, policy, horizon=float('inf'), action_filter=
         da = max(da, 1)    
     
         env.seed(seed)
-        seed_all_agent(seed)
+        seed_all_agent(seed, use_cuda=False) #sampling runs on CPU
         states = torch.zeros((horizon, ds),
                              dtype=torch.float)
         actions = torch.zeros((horizon, da),
@@ -132,11 +148,79 @@ def light_episode_generator(env, policy, horizon=float('inf'), disc=1., action_f
             t += 1
         return ret, uret, t, info_sum
     
-def generate_batch(env, policy, horizon, episodes, action_filter=None, render=False, n_jobs=False, seed=None, deterministic=False, key=None):
-    """Batch: list of (features, actions, rewards, mask) tuples"""
-    if not n_jobs:
-        gen = sequential_episode_generator(env, policy, horizon, episodes, action_filter, render, deterministic, key)
-        batch = [ep for ep in gen]
+def copy_envs(env, n, seed=None):
+    """n independently seeded copies of env, for vectorized_batch_generator.
+    Make them once, before env is ever rendered (viewers cannot be copied)"""
+    if seed is None:
+        seed = random.randint(0,999999)
+    envs = [copy.deepcopy(env) for _ in range(n)]
+    for i, e in enumerate(envs):
+        e.seed(seed*10000+i)
+    return envs
+
+def vectorized_batch_generator(envs, policy, horizon, action_filter=None, deterministic=False, key=None):
+    """Simulates one episode per environment (see copy_envs) in lockstep, 
+    querying the policy once per time step on the batch of current states 
+    (the policy must accept a batch of states, as Gaussian policies do)"""
+    episodes = len(envs)
+    ds = sum(envs[0].observation_space.shape)
+    ds = max(ds, 1)
+    da = sum(envs[0].action_space.shape)
+    da = max(da, 1)
+    
+    states, actions, rewards, mask, infos = _batch_buffers(episodes, horizon, 
+                                                           ds, da)
+    obs = [e.reset() for e in envs]
+    live = list(range(episodes))
+    t = 0
+    while live and t < horizon:
+        s = np.array([obs[i] for i in live], dtype=float)
+        s = torch.tensor(s, dtype=torch.float).view(len(live), -1)
+        a = policy.act(s, deterministic)
+        if not torch.is_tensor(a):
+            a = torch.tensor(a)
+        a = a.view(len(live), -1)
+        
+        still_live = []
+        for j, i in enumerate(live):
+            a_i = a[j]
+            if action_filter is not None:
+                a_i = action_filter(a_i)
+            next_s, r, done, info = envs[i].step(a_i.numpy())
+            
+            states[i, t] = s[j]
+            actions[i, t] = a_i
+            rewards[i, t] = r
+            mask[i, t] = 1
+            if key is not None and key in info:
+                infos[i, t] = info[key]
+            
+            obs[i] = next_s
+            if not done:
+                still_live.append(i)
+        live = still_live
+        t += 1
+    return Batch((states, actions, rewards, mask, infos))
+    
+def generate_batch(env, policy, horizon, episodes, action_filter=None, render=False, n_jobs=False, seed=None, deterministic=False, key=None, envs=None):
+    """Batch: list of (features, actions, rewards, mask) tuples
+    
+    envs: if given, copies of env (see copy_envs) on which the episodes 
+        are simulated in lockstep, one per copy (there must be as many 
+        copies as episodes)
+    """
+    if envs is not None and len(envs) != episodes:
+        raise ValueError('Expected %d environment copies, got %d' % (episodes, len(envs)))
+    if envs is not None and not render:
+        batch = vectorized_batch_generator(envs, policy, horizon, action_filter, deterministic, key)
+    elif not n_jobs:
+        ds = max(sum(env.observation_space.shape), 1)
+        da = max(sum(env.action_space.shape), 1)
+        buffers = _batch_buffers(episodes, horizon, ds, da)
+        gen = sequential_episode_generator(env, policy, horizon, episodes, action_filter, render, deterministic, key, buffers)
+        for _ in gen:
+            pass
+        batch = Batch(buffers)
     else:
         if seed is None:
             seed = random.randint(0,999999)
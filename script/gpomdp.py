@@ -50,7 +50,11 @@ parser.add_argument("--learnstd", help="Learn std",
                     action="store_true")
 parser.add_argument("--no-learnstd", help="Don't learn std",
                     action="store_false")
-parser.set_defaults(render=False, temp=False, learnstd=False, test=False) 
+parser.add_argument("--vectorized", help="Simulate the batch in lockstep",
+                    action="store_true")
+parser.add_argument("--no-vectorized", help="Simulate one episode at a time",
+                    action="store_false", dest="vectorized")
+parser.set_defaults(render=False, temp=False, learnstd=False, test=False, vectorized=False) 
 
 args = parser.parse_args()
 
@@ -106,4 +110,5 @@ reinforce(env, policy,
             estimator = args.estimator,
             baseline = args.baseline,
             test_batchsize=test_batchsize,
+            vectorized=args.vectorized,
             log_params=True)
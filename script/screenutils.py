@@ -3,17 +3,49 @@
 # Note: this may not work with bpython, use python 2.6 or upper
 # Author: Christophe Narbonne
 # Contrib: Alexis Metaireau
-from subprocess import getoutput
+from subprocess import run, call, PIPE
 from multiprocessing import Process
 from os import system
-from time import sleep
+from time import sleep, monotonic
+
+LS_TTL = 1. # seconds a parsed screen listing is reused
+_ls_cache = {'time': None, 'screens': {}}
+
+
+def _list_raw():
+    """Parse the output of screen -ls into {name: (id, date, status)},
+    reusing the last listing for LS_TTL seconds
+    """
+    now = monotonic()
+    if _ls_cache['time'] is None or now - _ls_cache['time'] > LS_TTL:
+        # output line sample:
+        # "\t28062.G.Terminal\t(01/17/2019 11:18:56 PM)\t(Detached)"
+        try:
+            output = run(['screen', '-ls'], stdout=PIPE, 
+                         universal_newlines=True).stdout
+        except OSError: # screen not installed
+            output = ''
+        screens = {}
+        for l in output.split('\n'):
+            if not l.startswith('\t'):
+                continue
+            infos = l.split('\t')[1:]
+            _id, _, name = infos[0].partition('.')
+            date = infos[1][1:-1] if len(infos) > 2 else None
+            screens[name] = (_id, date, infos[-1][1:-1])
+        _ls_cache['screens'] = screens
+        _ls_cache['time'] = now
+    return _ls_cache['screens']
+
+
+def _invalidate_list():
+    _ls_cache['time'] = None
 
 
 def list_screens():
     """List all the existing screens and build a Screen instance for each
     """
-    return [Screen(".".join(l.split(".")[1:]).split("\t")[0])
-                for l in getoutput("screen -ls | grep -P '\t'").split('\n')]
+    return [Screen(name) for name in _list_raw()]
 
 
 class ScreenNotFoundError(Exception):
@@ -58,17 +90,14 @@ class Screen(object):
     @property
     def exists(self):
         """Tell if the screen session exists or not."""
-        # output line sample:
-        # "     28062.G.Terminal        (Detached)"
-        lines = getoutput("screen -ls | grep " + self.name).split('\n')
-        return self.name in [".".join(l.split(".")[1:]).split("\t")[0]
-                             for l in lines]
+        return self.name in _list_raw()
 
     def create(self):
         """create a screen, if does not exists yet"""
         if not self.exists:
             Process(target=self._delayed_detach).start()
             system('screen -UR ' + self.name)
+            _invalidate_list()
 
     def interrupt(self):
         """Insert CTRL+C in the screen session"""
@@ -79,11 +108,13 @@ class Screen(object):
         """Kill the screen applications then quit the screen"""
         self._check_exists()
         system('screen -x ' + self.name + ' -X quit')
+        _invalidate_list()
 
     def detach(self):
         """detach the screen"""
         self._check_exists()
         system("screen -d " + self.name)
+        _invalidate_list()
 
     def _delayed_detach(self):
         sleep(5)
@@ -92,12 +123,13 @@ class Screen(object):
     def send_commands(self, commands):
         """send commands to the active gnu-screen"""
         self._check_exists()
+        stuffs = []
         for command in commands:
-            sleep(0.02)
             print(command)
-            system('screen -x ' + self.name + ' -X stuff "' + command + '" ')
-            sleep(0.02)
-            system('screen -x ' + self.name + ' -X eval "stuff \\015" ')
+            command = command.replace('\\', '\\\\').replace('"', '\\"')
+            stuffs.append('stuff "' + command + '\\015"')
+        # a single screen invocation types all the commands, each followed by CR
+        call(['screen', '-x', self.name, '-X', 'eval'] + stuffs)
 
     def _check_exists(self, message="Error code: 404"):
         """check whereas the screen exist. if not, raise an exception"""
@@ -106,11 +138,9 @@ class Screen(object):
 
     def _set_screen_infos(self):
         """set the screen information related parameters"""
-        if self.exists:
-            infos = getoutput("screen -ls | grep %s" % self.name).split('\t')[1:]
-            self._id = infos[0].split('.')[0]
-            self._date = infos[1][1:-1]
-            self._status = infos[2][1:-1]
+        screens = _list_raw()
+        if self.name in screens:
+            self._id, self._date, self._status = screens[self.name]
 
     def __repr__(self):
         return "<%s '%s'>" % (self.__class__.__name__, self.name)